@@ -0,0 +1,162 @@
+import json
+import gzip
+import base64
+import time
+import asyncio
+import httpx
+
+from typing import Any
+from collections import deque
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+REDACTED = "<redacted>"
+VOLATILE_PARAMS = {"text", "caption"}
+
+
+class _CassetteTransport(httpx.AsyncBaseTransport):
+    def __init__(self, secrets: list[str]) -> None:
+        self._secrets = sorted([secret for secret in secrets if secret], key=len)[::-1]
+
+    def _redact(self, text: str) -> str:
+        for secret in self._secrets:
+            text = text.replace(secret, REDACTED)
+        return text
+
+    @staticmethod
+    def _parse_json_rpc(body: str) -> Any:
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return None
+        calls = data if isinstance(data, list) else [data]
+        if not all(isinstance(call, dict) and "jsonrpc" in call for call in calls):
+            return None
+        for call in calls:
+            call.pop("id", None)
+        return data
+
+    def _get_keys(self, request: httpx.Request) -> tuple[str, str | None]:
+        url = self._redact(str(request.url))
+        body = self._redact(request.content.decode("utf-8", "replace"))
+        json_rpc = self._parse_json_rpc(body)
+        if json_rpc is not None:
+            return (
+                f"{request.method} {url} {json.dumps(json_rpc, sort_keys=True)}",
+                None,
+            )
+        split_url = urlsplit(url)
+        stable_query = urlencode(
+            [
+                (key, value)
+                for key, value in parse_qsl(split_url.query)
+                if key not in VOLATILE_PARAMS
+            ]
+        )
+        return (
+            f"{request.method} {url} {body}",
+            f"{request.method} {split_url._replace(query=stable_query).geturl()}",
+        )
+
+
+class RecordingTransport(_CassetteTransport):
+    def __init__(self, secrets: list[str]) -> None:
+        super().__init__(secrets)
+        self._transport = httpx.AsyncHTTPTransport()
+        self._origin = time.monotonic()
+        self.interactions = []
+
+    def _encode_content(self, content: bytes) -> dict:
+        try:
+            return {"content": self._redact(content.decode("utf-8"))}
+        except UnicodeDecodeError:
+            return {"content_base64": base64.b64encode(content).decode()}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        key, fallback_key = self._get_keys(request)
+        interaction = {
+            "key": key,
+            "fallback_key": fallback_key,
+            "offset": round(time.monotonic() - self._origin, 6),
+        }
+        started_at = time.monotonic()
+        try:
+            response = await self._transport.handle_async_request(request)
+            content = await response.aread()
+        except httpx.TransportError as e:
+            interaction.update(
+                elapsed=round(time.monotonic() - started_at, 6),
+                error=f"{type(e).__name__}: {self._redact(str(e))}",
+            )
+            self.interactions.append(interaction)
+            raise
+        interaction.update(
+            elapsed=round(time.monotonic() - started_at, 6),
+            status_code=response.status_code,
+            content_type=response.headers.get("content-type", ""),
+            **self._encode_content(content),
+        )
+        self.interactions.append(interaction)
+        return httpx.Response(
+            status_code=response.status_code,
+            headers={"content-type": interaction["content_type"]},
+            content=content,
+            request=request,
+        )
+
+    def save(self, path: str) -> None:
+        with gzip.open(path, mode="wt") as f:
+            json.dump({"version": 2, "interactions": self.interactions}, f)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+class ReplayTransport(_CassetteTransport):
+    def __init__(self, path: str, secrets: list[str], realtime: bool = True) -> None:
+        super().__init__(secrets)
+        with gzip.open(path, mode="rt") as f:
+            self._interactions = json.load(f)["interactions"]
+        self._realtime = realtime
+        self._used = [False] * len(self._interactions)
+        self._queues = {}
+        for index, interaction in enumerate(self._interactions):
+            for key in [interaction["key"], interaction["fallback_key"]]:
+                if key is None:
+                    continue
+                if key not in self._queues:
+                    self._queues[key] = deque()
+                self._queues[key].append(index)
+
+    def _pop(self, key: str) -> int | None:
+        queue = self._queues.get(key, deque())
+        while len(queue) > 0:
+            index = queue.popleft()
+            if not self._used[index]:
+                self._used[index] = True
+                return index
+        return None
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        key, fallback_key = self._get_keys(request)
+        index = self._pop(key)
+        if index is None and fallback_key is not None:
+            index = self._pop(fallback_key)
+        if index is None:
+            raise httpx.TransportError(f"no recorded response for {key[0:200]}")
+        interaction = self._interactions[index]
+        if self._realtime:
+            await asyncio.sleep(interaction["elapsed"])
+        if "error" in interaction:
+            raise httpx.TransportError(interaction["error"])
+        return httpx.Response(
+            status_code=interaction["status_code"],
+            headers={"content-type": interaction["content_type"]},
+            content=(
+                interaction["content"].encode()
+                if "content" in interaction
+                else base64.b64decode(interaction["content_base64"])
+            ),
+            request=request,
+        )
@@ -1,15 +1,36 @@
+import io
 import os
+import csv
 import sys
+import json
+import time
 import asyncio
 import traceback
+import tracemalloc
+import profiler
 
 from dotenv import load_dotenv
 from pathlib import Path
 from decimal import Decimal
 from pprint import pprint
 
-from state_manager import State, TrackedWallet
-from svm import Solana, Transaction, SPL
+from cassette import RecordingTransport, ReplayTransport
+from http_client import Client, HTTPStatusError, get_remaining_time, decode_json
+from solscan import TRANSACTION_DETAIL_FIELDS, get_program_ids
+from state_manager import State, TrackedWallet, PendingWalletUpdate
+from price import PriceCache, JupiterPriceAPI, StaticPriceProvider
+from svm import (
+    Solana,
+    Transaction,
+    SPL,
+    serialize_transaction,
+    deserialize_transaction,
+    get_token_mint,
+    is_valid_address,
+    diff_snapshots,
+    classify_transaction,
+    compile_program_labels,
+)
 from telegram import (
     TelegramBot,
     generate_transaction_message,
@@ -20,19 +41,33 @@ from telegram import (
 
 load_dotenv()
 
-SOLANA_RPC_HTTP_URL = os.environ["SOLANA_RPC_HTTP_URL"]
+SOLANA_RPC_HTTP_URLS = os.environ["SOLANA_RPC_HTTP_URL"].split(",")
 SOLSCAN_API_TOKEN = os.environ["SOLSCAN_API_V1"]
 TELEGRAM_BOT_TOKEN = os.environ["TELEGRAM_BOT_TOKEN"]
 WHALE_TRACKER_CHAT_ID = os.environ["WHALE_TRACKER_CHAT_ID"]
 WHALE_LOGS_CHAT_ID = os.environ["WHALE_LOGS_CHAT_ID"]
+CYCLE_DEADLINE_SECONDS = float(os.environ.get("CYCLE_DEADLINE_SECONDS", "45"))
+HOLDINGS_DEADLINE_SECONDS = float(os.environ.get("HOLDINGS_DEADLINE_SECONDS", "30"))
+PRICE_TTL_SECONDS = float(os.environ.get("PRICE_TTL_SECONDS", "300"))
+STATIC_PRICE_FILE = os.environ.get("STATIC_PRICE_FILE")
 
-solana = Solana(SOLANA_RPC_HTTP_URL, SOLSCAN_API_TOKEN)
 bot = TelegramBot(TELEGRAM_BOT_TOKEN)
 state = State(f"{Path(__file__).parent}/.state")
+solana = Solana(
+    SOLANA_RPC_HTTP_URLS, SOLSCAN_API_TOKEN, state.get_program_labels()  # type: ignore
+)
+if STATIC_PRICE_FILE:
+    price_cache = PriceCache(
+        StaticPriceProvider.from_file(STATIC_PRICE_FILE), PRICE_TTL_SECONDS
+    )
+else:
+    price_cache = PriceCache(
+        JupiterPriceAPI(), PRICE_TTL_SECONDS, state.get_price_cache()
+    )
 
 
 def _get_message_and_timestamp(
-    wallet: TrackedWallet, transaction: Transaction
+    wallet: TrackedWallet | PendingWalletUpdate, transaction: Transaction
 ) -> tuple[str, int]:
     message = generate_transaction_message(wallet["group"], wallet["name"], transaction)
     return message, transaction["block_time"]
@@ -49,42 +84,268 @@ def _get_ignored_wallets(
 
 
 async def _track_one_wallet(
-    address: str, wallet: TrackedWallet, all_wallets: dict[str, TrackedWallet]
-) -> tuple[tuple[str, str], list[tuple[str, int]]] | None:
+    address: str,
+    wallet: TrackedWallet,
+    all_wallets: dict[str, TrackedWallet],
+    deadline: float | None = None,
+) -> tuple[list[Transaction], str | None]:
     ignored_wallets = _get_ignored_wallets(address, wallet, all_wallets)
-    if not wallet["last_updated_hash"]:
-        transactions = await solana.get_transactions(
-            address, ignore_internal_transfers=ignored_wallets
-        )
-        transactions = transactions[-1::]
-    else:
-        transactions = await solana.get_transactions(
+    with profiler.tagged(wallet=address):
+        if not wallet["last_updated_hash"]:
+            transactions, checkpoint = await solana.get_transactions(
+                address, ignore_internal_transfers=ignored_wallets, deadline=deadline
+            )
+            return transactions[-1::], checkpoint
+        else:
+            return await solana.get_transactions(
+                address,
+                after_hash=wallet["last_updated_hash"],
+                ignore_internal_transfers=ignored_wallets,
+                deadline=deadline,
+            )
+
+
+async def _track_and_checkpoint_one_wallet(
+    address: str,
+    wallet: TrackedWallet,
+    all_wallets: dict[str, TrackedWallet],
+    deadline: float | None = None,
+) -> None:
+    transactions, checkpoint = await _track_one_wallet(
+        address, wallet, all_wallets, deadline
+    )
+    if len(transactions) > 0:
+        state.add_pending_wallet_update(
             address,
-            after_hash=wallet["last_updated_hash"],
-            ignore_internal_transfers=ignored_wallets,
+            wallet["name"],
+            wallet["group"],
+            [serialize_transaction(transaction) for transaction in transactions],
         )
-    if len(transactions) > 0:
-        if wallet["group"] not in CLI.lifespan_globals["mentioned_tokens_by_group"]:
-            CLI.lifespan_globals["mentioned_tokens_by_group"][wallet["group"]] = []
-        for transaction in transactions:
+    if checkpoint:
+        state.update_tracked_wallet(address, last_updated_hash=checkpoint)
+
+
+async def _annotate_usd_values(transactions: list[Transaction]) -> None:
+    token_actions = [
+        token_action
+        for transaction in transactions
+        for token_action in transaction["token_actions"]
+    ]
+    with profiler.tagged(stage="prices"):
+        prices = await price_cache.get_prices(
+            [get_token_mint(token_action) for token_action in token_actions]
+        )
+    for token_action in token_actions:
+        mint = get_token_mint(token_action)
+        if mint in prices:
+            token_action["usd_value"] = token_action["amount"] * prices[mint]
+
+
+def _filter_by_notional(
+    transactions: list[Transaction], min_usd_notional: Decimal
+) -> list[Transaction]:
+    filtered_transactions = []
+    for transaction in transactions:
+        token_actions = [
+            token_action
+            for token_action in transaction["token_actions"]
+            if "usd_value" not in token_action
+            or abs(token_action["usd_value"]) >= min_usd_notional
+        ]
+        if len(token_actions) > 0:
+            filtered_transactions.append({**transaction, "token_actions": token_actions})
+    return filtered_transactions
+
+
+async def _get_transactions_by_wallet(
+    pending_updates: dict[str, PendingWalletUpdate]
+) -> dict[str, list[Transaction]]:
+    transactions_by_wallet = {
+        address: [
+            deserialize_transaction(transaction)
+            for transaction in pending_updates[address]["transactions"]
+        ]
+        for address in pending_updates
+    }
+    try:
+        await _annotate_usd_values(
+            [
+                transaction
+                for address in transactions_by_wallet
+                for transaction in transactions_by_wallet[address]
+            ]
+        )
+    except:
+        await bot.send_message(
+            WHALE_LOGS_CHAT_ID, traceback.format_exc(), parse_mode="markdown"
+        )
+    server_params = state.get_server_params()
+    min_usd_notional = (
+        server_params["min_usd_notional"] if "min_usd_notional" in server_params else {}
+    )
+    return {
+        address: (
+            _filter_by_notional(
+                transactions_by_wallet[address],
+                Decimal(min_usd_notional[pending_updates[address]["group"]]),
+            )
+            if pending_updates[address]["group"] in min_usd_notional
+            else transactions_by_wallet[address]
+        )
+        for address in transactions_by_wallet
+    }
+
+
+async def _track_snapshot_wallets(
+    wallets: dict[str, TrackedWallet], deadline: float | None = None
+) -> dict[str, tuple[list[Transaction], dict[str, list]]]:
+    if len(wallets) == 0:
+        return {}
+    with profiler.tagged(stage="snapshots"):
+        snapshots = await asyncio.wait_for(
+            solana.get_portfolio_snapshots(list(wallets)),
+            timeout=get_remaining_time(deadline),
+        )
+    previous_snapshots = state.get_snapshots(list(snapshots))
+    token_metas = state.get_token_metas()
+    block_time = int(time.time())
+    tracked_snapshots = {}
+    for address in snapshots:
+        transactions = []
+        if address in previous_snapshots:
+            token_actions = diff_snapshots(
+                previous_snapshots[address], snapshots[address], token_metas  # type: ignore
+            )
+            if len(token_actions) > 0:
+                transactions.append(
+                    {
+                        "transaction_hash": f"snapshot-{block_time}",
+                        "token_actions": token_actions,
+                        "block_time": block_time,
+                        "labels": "Position Change",
+                        "account": address,
+                    }
+                )
+        if previous_snapshots.get(address) != snapshots[address]:
+            tracked_snapshots[address] = (transactions, snapshots[address])
+    return tracked_snapshots
+
+
+async def _track_and_checkpoint_snapshot_wallets(
+    wallets: dict[str, TrackedWallet], deadline: float | None = None
+) -> None:
+    tracked_snapshots = await _track_snapshot_wallets(wallets, deadline)
+    for address in tracked_snapshots:
+        transactions, snapshot = tracked_snapshots[address]
+        if len(transactions) > 0:
+            state.add_pending_wallet_update(
+                address,
+                wallets[address]["name"],
+                wallets[address]["group"],
+                [serialize_transaction(transaction) for transaction in transactions],
+            )
+        state.update_snapshot(address, snapshot)
+
+
+def _collect_mentioned_tokens(
+    pending_updates: dict[str, PendingWalletUpdate],
+    transactions_by_wallet: dict[str, list[Transaction]],
+) -> None:
+    CLI.lifespan_globals["mentioned_tokens_by_group"] = {}
+    for address in transactions_by_wallet:
+        group = pending_updates[address]["group"]
+        if group not in CLI.lifespan_globals["mentioned_tokens_by_group"]:
+            CLI.lifespan_globals["mentioned_tokens_by_group"][group] = []
+        for transaction in transactions_by_wallet[address]:
             for token_action in transaction["token_actions"]:
                 token = (
                     token_action["token"] if token_action["token"] != "SOL" else None
                 )
-                if (
-                    token
-                    and token
-                    not in CLI.lifespan_globals["mentioned_tokens_by_group"][
-                        wallet["group"]
-                    ]
-                ):
-                    CLI.lifespan_globals["mentioned_tokens_by_group"][
-                        wallet["group"]
-                    ].append(token)
-        return (address, transactions[-1]["transaction_hash"]), [
-            _get_message_and_timestamp(wallet, transaction)
-            for transaction in transactions
+                if token and token["mint"] not in [
+                    mentioned_token["mint"]
+                    for mentioned_token in CLI.lifespan_globals[
+                        "mentioned_tokens_by_group"
+                    ][group]
+                ]:
+                    CLI.lifespan_globals["mentioned_tokens_by_group"][group].append(
+                        token
+                    )
+
+
+def _compose_tracking_report(
+    pending_updates: dict[str, PendingWalletUpdate],
+    transactions_by_wallet: dict[str, list[Transaction]],
+) -> str:
+    _collect_mentioned_tokens(pending_updates, transactions_by_wallet)
+    message_stream = []
+    for address in transactions_by_wallet:
+        message_stream += [
+            _get_message_and_timestamp(pending_updates[address], transaction)
+            for transaction in transactions_by_wallet[address]
+        ]
+    summary_message = SEPARATOR.join(
+        [
+            message
+            for message, _ in sorted(
+                message_stream,
+                key=lambda message_and_timestamp: message_and_timestamp[1],
+            )
         ]
+    )
+    token_summary = _get_token_summary()
+    message = SEPARATOR.join([summary_message, token_summary])
+    if len(message) > 4096:
+        message = SEPARATOR.join(
+            ["Txs omitted because the message is too long", token_summary]
+        )
+    return message
+
+
+def _is_permanent_failure(error: Exception) -> bool:
+    return (
+        isinstance(error, HTTPStatusError)
+        and 400 <= error.status_code < 500
+        and error.status_code != 429
+    )
+
+
+async def _deliver_outbox(attempts: int = 3) -> None:
+    for message_id, outbox_message in state.get_outbox_messages():
+        for attempt in range(attempts):
+            try:
+                with profiler.tagged(stage="delivery"):
+                    await bot.send_message(
+                        outbox_message["chat_id"],
+                        outbox_message["message"],
+                        parse_mode=outbox_message["parse_mode"],
+                    )
+                state.remove_outbox_message(message_id)
+                break
+            except Exception as e:
+                if _is_permanent_failure(e):
+                    state.move_outbox_message_to_dead(message_id)
+                    await bot.send_message(
+                        WHALE_LOGS_CHAT_ID,
+                        f"moved undeliverable message {message_id} to outbox/dead:\n"
+                        + str(e)[0:1000],
+                        parse_mode="",
+                    )
+                    break
+                if attempt == attempts - 1:
+                    await bot.send_message(
+                        WHALE_LOGS_CHAT_ID,
+                        f"delivery of message {message_id} failed, "
+                        "it will be retried next cycle:\n" + str(e)[0:1000],
+                        parse_mode="",
+                    )
+                    return
+                await asyncio.sleep(2**attempt)
+
+
+def _truncate_message(message: str, limit: int = 4096) -> str:
+    if len(message) <= limit:
+        return message
+    return message[0 : message.rfind("\n", 0, limit - 4)] + "\n..."
 
 
 async def _get_total_balance(wallets: list[str], token: SPL) -> tuple[str, Decimal]:
@@ -94,49 +355,154 @@ async def _get_total_balance(wallets: list[str], token: SPL) -> tuple[str, Decim
     return token["ticker"], Decimal(sum(balances))
 
 
+def _get_holding_line(ticker: str, balance: Decimal, price: Decimal | None) -> str:
+    usd_value = f" (~${balance * price:,.2f})" if price is not None else ""
+    return f"<b>{ticker}</b>: {balance}{usd_value}"
+
+
 async def _get_current_holding_message_for_group(
     group: str, wallets: list[str], tokens: list[SPL]
 ) -> str:
     response = await asyncio.gather(
         *[_get_total_balance(wallets, token) for token in tokens]
     )
+    try:
+        prices = await price_cache.get_prices([token["mint"] for token in tokens])
+    except:
+        prices = {}
     return f"Current holdings of mentioned tokens:\n<b>{group}</b>\n\n" + "\n".join(
-        [f"<b>{ticker}</b>: {balance}" for ticker, balance in response]
+        [
+            _get_holding_line(ticker, balance, prices.get(token["mint"]))
+            for (ticker, balance), token in zip(response, tokens)
+        ]
     )
 
 
 def _get_token_summary() -> str:
-    unique_tokens = []
+    unique_tokens = {}
     for group in CLI.lifespan_globals["mentioned_tokens_by_group"]:
         for token in CLI.lifespan_globals["mentioned_tokens_by_group"][group]:
-            if token not in unique_tokens:
-                unique_tokens.append(token)
+            if token["mint"] not in unique_tokens:
+                unique_tokens[token["mint"]] = token
     return "Token detail for mentioned tokens\n\n" + "\n".join(
         [
             f"<b>{token['ticker']}</b> ({token['name']}): <code>{token['mint']}</code>"
-            for token in unique_tokens
+            for token in unique_tokens.values()
         ]
     )
 
 
-async def _get_current_holding(all_wallets: dict[str, TrackedWallet]) -> str:
+async def _get_current_holding(
+    all_wallets: dict[str, TrackedWallet], deadline: float | None = None
+) -> tuple[str, list[str]]:
     wallets_by_group = {}
     for wallet in all_wallets:
         group = all_wallets[wallet]["group"]
         if group not in wallets_by_group:
             wallets_by_group[group] = []
         wallets_by_group[group].append(wallet)
-    group_reports = await asyncio.gather(
-        *[
-            _get_current_holding_message_for_group(
-                group,
-                wallets_by_group[group],
-                CLI.lifespan_globals["mentioned_tokens_by_group"][group],
+    with profiler.tagged(stage="holdings"):
+        tasks = {
+            group: asyncio.create_task(
+                _get_current_holding_message_for_group(
+                    group,
+                    wallets_by_group[group],
+                    CLI.lifespan_globals["mentioned_tokens_by_group"][group],
+                )
             )
             for group in CLI.lifespan_globals["mentioned_tokens_by_group"]
+            if group in wallets_by_group
+        }
+    if len(tasks) > 0:
+        await asyncio.wait(tasks.values(), timeout=get_remaining_time(deadline))
+    group_reports = []
+    timed_out_groups = []
+    for group in tasks:
+        if tasks[group].done():
+            group_reports.append(tasks[group].result())
+        else:
+            tasks[group].cancel()
+            timed_out_groups.append(group)
+    return SEPARATOR.join(group_reports), timed_out_groups
+
+
+def _parse_wallet_file(file_name: str, content: bytes) -> list[dict]:
+    if file_name.lower().endswith(".json"):
+        return decode_json(content)  # type: ignore
+    return list(csv.DictReader(io.StringIO(content.decode("utf-8-sig"))))
+
+
+def _dump_wallet_file(file_name: str, all_wallets: dict[str, TrackedWallet]) -> bytes:
+    rows = [
+        {"address": address, "mode": "transactions", **all_wallets[address]}
+        for address in all_wallets
+    ]
+    if file_name.lower().endswith(".json"):
+        return json.dumps(rows, indent=2).encode()
+    output = io.StringIO()
+    writer = csv.DictWriter(
+        output, fieldnames=["address", "name", "group", "last_updated_hash", "mode"]
+    )
+    writer.writeheader()
+    writer.writerows(rows)
+    return output.getvalue().encode()
+
+
+async def _import_wallets(
+    rows: list[dict], seed_checkpoints: bool = False, mints: list[str] | None = None
+) -> str:
+    all_wallets = state.get_all_tracked_wallets()
+    new_wallets = {}
+    invalid_rows = []
+    skipped = 0
+    for row in rows:
+        address, name, group = [
+            str(row.get(key) or "").strip() for key in ["address", "name", "group"]
         ]
+        if not name or not group or not is_valid_address(address):
+            invalid_rows.append(address or "(empty)")
+        elif address in all_wallets or address in new_wallets:
+            skipped += 1
+        else:
+            new_wallets[address] = {
+                "name": name,
+                "group": group,
+                "last_updated_hash": row.get("last_updated_hash") or None,
+                "mode": (
+                    "snapshot" if row.get("mode") == "snapshot" else "transactions"
+                ),
+            }
+    if seed_checkpoints:
+        latest_signatures = await solana.get_latest_signatures(
+            [
+                address
+                for address in new_wallets
+                if not new_wallets[address]["last_updated_hash"]
+                and new_wallets[address]["mode"] == "transactions"
+            ]
+        )
+        for address in latest_signatures:
+            new_wallets[address]["last_updated_hash"] = latest_signatures[address]
+    valid_mints = [mint for mint in mints or [] if is_valid_address(mint)]
+    if len(valid_mints) > 0:
+        state.update_token_accounts(
+            {
+                f"{mint}:{address}": solana.get_associated_token_account(mint, address)
+                for mint in valid_mints
+                for address in new_wallets
+            }
+        )
+    state.track_new_wallets(new_wallets)
+    report = (
+        f"imported <b>{len(new_wallets)}</b> wallets, "
+        f"skipped <b>{skipped}</b> already tracked, "
+        f"rejected <b>{len(invalid_rows)}</b> invalid rows"
     )
-    return SEPARATOR.join(group_reports)
+    if len(invalid_rows) > 0:
+        report += "\n\n" + "\n".join(
+            [f"<code>{address}</code>" for address in invalid_rows[0:20]]
+        )
+    return report
 
 
 def _is_admin(user: str) -> bool:
@@ -187,6 +553,7 @@ async def _process_telegram_methods(telegram_method: TelegramMethod) -> None:
                         telegram_method["kwargs"]["address"],
                         telegram_method["kwargs"]["name"],
                         telegram_method["kwargs"]["group"],
+                        telegram_method["kwargs"].get("mode", "transactions"),
                     )
                     message = "successfully added wallet <b>{}</b> to tracker".format(
                         telegram_method["kwargs"]["address"]
@@ -206,11 +573,19 @@ async def _process_telegram_methods(telegram_method: TelegramMethod) -> None:
                     for key in ["name", "group"]
                     if key in telegram_method["kwargs"]
                 }
-                if len(valid_kwargs) > 0:
+                mode = telegram_method["kwargs"].get("mode")
+                if mode not in ["transactions", "snapshot"]:
+                    mode = None
+                if len(valid_kwargs) > 0 or mode is not None:
                     try:
-                        state.update_tracked_wallet(
-                            telegram_method["kwargs"]["address"], **valid_kwargs
-                        )
+                        if len(valid_kwargs) > 0:
+                            state.update_tracked_wallet(
+                                telegram_method["kwargs"]["address"], **valid_kwargs
+                            )
+                        if mode is not None:
+                            state.set_wallet_mode(
+                                telegram_method["kwargs"]["address"], mode
+                            )
                         message = "successfully updated wallet <b>{}</b>".format(
                             telegram_method["kwargs"]["address"]
                         )
@@ -234,6 +609,68 @@ async def _process_telegram_methods(telegram_method: TelegramMethod) -> None:
                         telegram_method["kwargs"]["address"]
                     )
                 await bot.send_message(WHALE_TRACKER_CHAT_ID, message)
+        case "set_min_notional":
+            if (
+                _is_admin(telegram_method["user"])
+                and "group" in telegram_method["kwargs"]
+                and "usd" in telegram_method["kwargs"]
+            ):
+                try:
+                    min_usd_notional = Decimal(telegram_method["kwargs"]["usd"])
+                    server_params = state.get_server_params()
+                    min_usd_notional_by_group = (
+                        server_params["min_usd_notional"]
+                        if "min_usd_notional" in server_params
+                        else {}
+                    )
+                    if min_usd_notional > 0:
+                        min_usd_notional_by_group[telegram_method["kwargs"]["group"]] = (
+                            str(min_usd_notional)
+                        )
+                    else:
+                        min_usd_notional_by_group.pop(
+                            telegram_method["kwargs"]["group"], None
+                        )
+                    state.update_server_params(
+                        min_usd_notional=min_usd_notional_by_group
+                    )
+                    message = "successfully set minimum notional for <b>{}</b>".format(
+                        telegram_method["kwargs"]["group"]
+                    )
+                except:
+                    message = "failed to set minimum notional for <b>{}</b>".format(
+                        telegram_method["kwargs"]["group"]
+                    )
+                await bot.send_message(WHALE_TRACKER_CHAT_ID, message)
+        case "import_wallets":
+            if _is_admin(telegram_method["user"]) and "document" in telegram_method:
+                try:
+                    content = await bot.download_document(
+                        telegram_method["document"]["file_id"]
+                    )
+                    message = await _import_wallets(
+                        _parse_wallet_file(
+                            telegram_method["document"]["file_name"], content
+                        ),
+                        seed_checkpoints=telegram_method["kwargs"]
+                        .get("seed_checkpoints", "")
+                        .lower()
+                        == "true",
+                    )
+                except:
+                    message = "failed to import wallets from <b>{}</b>".format(
+                        telegram_method["document"]["file_name"]
+                    )
+                await bot.send_message(WHALE_TRACKER_CHAT_ID, message)
+        case "export_wallets":
+            file_name = "tracked_wallets.{}".format(
+                "json" if telegram_method["kwargs"].get("format") == "json" else "csv"
+            )
+            await bot.send_document(
+                WHALE_TRACKER_CHAT_ID,
+                file_name,
+                _dump_wallet_file(file_name, state.get_all_tracked_wallets()),
+            )
         case "rename_group":
             if (
                 _is_admin(telegram_method["user"])
@@ -267,55 +704,165 @@ class CLI:
     async def track_wallets(test: bool = False) -> None:
         try:
             CLI.lifespan_globals["mentioned_tokens_by_group"] = {}
+            if not test:
+                try:
+                    await _deliver_outbox()
+                except:
+                    traceback.print_exc()
+            solana.load_token_accounts(state.get_token_accounts())
+            deadline = time.monotonic() + CYCLE_DEADLINE_SECONDS
             all_wallets = state.get_all_tracked_wallets()
-            tracked_data = await asyncio.gather(
-                *[
-                    _track_one_wallet(wallet, all_wallets[wallet], all_wallets)
-                    for wallet in all_wallets
-                ]
-            )
-            non_empty_data = [
-                wallet_data for wallet_data in tracked_data if wallet_data is not None
-            ]
-            message_stream = []
-            for _, message_and_timestamp in non_empty_data:
-                message_stream += message_and_timestamp
-            sorted_messages = [
-                message
-                for message, _ in sorted(
-                    message_stream,
-                    key=lambda message_and_timestamp: message_and_timestamp[1],
+            transaction_wallets = {
+                wallet: all_wallets[wallet]
+                for wallet in all_wallets
+                if all_wallets[wallet].get("mode", "transactions") != "snapshot"
+            }
+            snapshot_wallets = {
+                wallet: all_wallets[wallet]
+                for wallet in all_wallets
+                if wallet not in transaction_wallets
+            }
+            if not test:
+                results = await asyncio.gather(
+                    *[
+                        _track_and_checkpoint_one_wallet(
+                            wallet, all_wallets[wallet], all_wallets, deadline
+                        )
+                        for wallet in transaction_wallets
+                    ],
+                    _track_and_checkpoint_snapshot_wallets(snapshot_wallets, deadline),
+                    return_exceptions=True,
                 )
-            ]
-            if len(sorted_messages) > 0:
-                summary_message = SEPARATOR.join(sorted_messages)
-                holding_message = await _get_current_holding(all_wallets)
-                token_summary = _get_token_summary()
-                message = SEPARATOR.join(
-                    [summary_message, holding_message, token_summary]
+                pending_updates = state.get_pending_wallet_updates()
+            else:
+                results = await asyncio.gather(
+                    *[
+                        _track_one_wallet(
+                            wallet, all_wallets[wallet], all_wallets, deadline
+                        )
+                        for wallet in transaction_wallets
+                    ],
+                    _track_snapshot_wallets(snapshot_wallets, deadline),
+                    return_exceptions=True,
                 )
-                if len(message) > 4096:
-                    message = SEPARATOR.join(
-                        [
-                            "Txs omitted because the message is too long",
-                            holding_message,
-                            token_summary,
-                        ]
+                tracked_transactions = {
+                    wallet: result[0] if isinstance(result, tuple) else result
+                    for wallet, result in zip(transaction_wallets, results)
+                }
+                if isinstance(results[-1], dict):
+                    tracked_transactions.update(
+                        {
+                            wallet: transactions
+                            for wallet, (transactions, _) in results[-1].items()
+                        }
                     )
+                pending_updates = {
+                    wallet: {
+                        "name": all_wallets[wallet]["name"],
+                        "group": all_wallets[wallet]["group"],
+                        "transactions": [
+                            serialize_transaction(transaction)
+                            for transaction in transactions
+                        ],
+                        "last_updated_hash": transactions[-1]["transaction_hash"],
+                    }
+                    for wallet, transactions in tracked_transactions.items()
+                    if isinstance(transactions, list) and len(transactions) > 0
+                }
+            if len(pending_updates) > 0:
+                transactions_by_wallet = await _get_transactions_by_wallet(
+                    pending_updates
+                )
                 if not test:
-                    await bot.send_message(WHALE_TRACKER_CHAT_ID, message)
-                else:
-                    print(message)
-            if not test:
-                for (address, last_updated_hash), _ in non_empty_data:
-                    state.update_tracked_wallet(
-                        address, last_updated_hash=last_updated_hash
+                    if not STATIC_PRICE_FILE:
+                        state.update_price_cache(price_cache.dump())
+                    state.update_token_metas(
+                        {
+                            token_action["token"]["mint"]: token_action["token"]
+                            for address in transactions_by_wallet
+                            for transaction in transactions_by_wallet[address]
+                            if "account" not in transaction
+                            for token_action in transaction["token_actions"]
+                            if token_action["token"] != "SOL"
+                        }
+                    )
+                if any(
+                    len(transactions_by_wallet[address]) > 0
+                    for address in transactions_by_wallet
+                ):
+                    message = _compose_tracking_report(
+                        pending_updates, transactions_by_wallet
+                    )
+                    if not test:
+                        state.enqueue_message(WHALE_TRACKER_CHAT_ID, message)
+                    else:
+                        print(message)
+                if not test:
+                    state.clear_pending_wallet_updates(list(pending_updates))
+                    await _deliver_outbox()
+            lagging_wallets = [
+                wallet
+                for wallet, result in zip(
+                    [*transaction_wallets, "snapshot wallets"], results
+                )
+                if isinstance(result, asyncio.TimeoutError)
+            ]
+            if len(lagging_wallets) > 0:
+                await bot.send_message(
+                    WHALE_LOGS_CHAT_ID,
+                    "carried over wallets past the cycle deadline:\n"
+                    + "\n".join(lagging_wallets),
+                    parse_mode="markdown",
+                )
+            for result in results:
+                if isinstance(result, Exception) and not isinstance(
+                    result, asyncio.TimeoutError
+                ):
+                    await bot.send_message(
+                        WHALE_LOGS_CHAT_ID,
+                        "".join(traceback.format_exception(result)),
+                        parse_mode="markdown",
+                    )
+            if len(CLI.lifespan_globals["mentioned_tokens_by_group"]) > 0:
+                holding_message, timed_out_groups = await _get_current_holding(
+                    all_wallets, time.monotonic() + HOLDINGS_DEADLINE_SECONDS
+                )
+                if len(holding_message) > 0:
+                    holding_message = _truncate_message(holding_message)
+                    if not test:
+                        state.enqueue_message(WHALE_TRACKER_CHAT_ID, holding_message)
+                        await _deliver_outbox()
+                    else:
+                        print(holding_message)
+                if len(timed_out_groups) > 0:
+                    await bot.send_message(
+                        WHALE_LOGS_CHAT_ID,
+                        "skipped holdings past the holdings deadline:\n"
+                        + "\n".join(timed_out_groups),
+                        parse_mode="markdown",
                     )
         except:
             await bot.send_message(
                 WHALE_LOGS_CHAT_ID, traceback.format_exc(), parse_mode="markdown"
             )
 
+    @staticmethod
+    async def import_wallets(
+        file_path: str, seed_checkpoints: str = "false", *mints: str
+    ) -> None:
+        with open(file_path, mode="rb") as f:
+            rows = _parse_wallet_file(file_path, f.read())
+        print(
+            await _import_wallets(
+                rows, seed_checkpoints.lower() == "true", list(mints)
+            )
+        )
+
+    @staticmethod
+    async def export_wallets(file_path: str) -> None:
+        with open(file_path, mode="wb") as f:
+            f.write(_dump_wallet_file(file_path, state.get_all_tracked_wallets()))
+
     @staticmethod
     async def get_transaction_details(transaction_hash) -> None:
         response = await solana.solscan_api.get_transaction_details(transaction_hash)
@@ -328,6 +875,67 @@ class CLI:
         )
         pprint(response)
 
+    @staticmethod
+    async def benchmark_json_decode(payload_file: str, iterations: str = "1000") -> None:
+        with open(payload_file, mode="rb") as f:
+            recorded = json.load(f)
+        payloads = [
+            json.dumps(payload).encode()
+            for payload in (recorded if isinstance(recorded, list) else [recorded])
+        ]
+        decoders = {
+            "stdlib text": lambda content: json.loads(content.decode()),
+            "projected bytes": lambda content: decode_json(
+                content, TRANSACTION_DETAIL_FIELDS
+            ),
+        }
+        for name in decoders:
+            tracemalloc.start()
+            start = time.perf_counter()
+            for _ in range(int(iterations)):
+                decoded = [decoders[name](content) for content in payloads]
+            elapsed = time.perf_counter() - start
+            retained, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del decoded
+            print(
+                f"{name}: {elapsed / int(iterations) / len(payloads) * 10**6:.1f} us/tx, "
+                f"retained {retained / len(payloads) / 1024:.1f} KiB/tx, "
+                f"peak {peak / 1024:.1f} KiB"
+            )
+
+    @staticmethod
+    async def benchmark_label_classification(
+        corpus_file: str, iterations: str = "1000"
+    ) -> None:
+        with open(corpus_file, mode="rb") as f:
+            corpus = decode_json(f.read())
+        program_lists = [
+            get_program_ids(payload)  # type: ignore
+            for payload in (corpus if isinstance(corpus, list) else [corpus])
+        ]
+        padding_labels = [
+            {"label": f"Padding {i}", "category": "padding", "programs": [f"pad{i}"]}
+            for i in range(10000)
+        ]
+        registries = {
+            "configured": solana.label_index,
+            "configured + 10000 labels": compile_program_labels(
+                padding_labels  # type: ignore
+            )
+            | solana.label_index,
+        }
+        for name in registries:
+            start = time.perf_counter()
+            for _ in range(int(iterations)):
+                for programs in program_lists:
+                    classify_transaction(programs, [], registries[name])
+            elapsed = time.perf_counter() - start
+            print(
+                f"{name} ({len(registries[name])} programs): "
+                f"{int(iterations) * len(program_lists) / elapsed:,.0f} tx/s"
+            )
+
     @staticmethod
     async def interpret_transaction(
         transaction_hash: str, owner: str, *ignored_internal_addresses
@@ -360,6 +968,32 @@ class CLI:
 
 
 if __name__ == "__main__":
-    method = sys.argv[1]
-    args = sys.argv[2::]
-    asyncio.run(getattr(CLI, method)(*args))
+    options = {
+        key: value
+        for key, _, value in [
+            arg[2::].partition("=") for arg in sys.argv[1::] if arg.startswith("--")
+        ]
+    }
+    method = [arg for arg in sys.argv[1::] if not arg.startswith("--")][0]
+    args = [arg for arg in sys.argv[1::] if not arg.startswith("--")][1::]
+    secrets = [SOLSCAN_API_TOKEN, TELEGRAM_BOT_TOKEN, *SOLANA_RPC_HTTP_URLS]
+    if "record" in options:
+        Client.transport = RecordingTransport(secrets)
+    elif "replay" in options:
+        Client.transport = ReplayTransport(
+            options["replay"], secrets, realtime="replay-fast" not in options
+        )
+    try:
+        if "profile" in options:
+            report = profiler.run(
+                getattr(CLI, method),
+                *args,
+                name=method,
+                output_dir=state.get_profiles_dir(),
+            )
+            print(f"profile report written to {report}")
+        else:
+            asyncio.run(getattr(CLI, method)(*args))
+    finally:
+        if isinstance(Client.transport, RecordingTransport):
+            Client.transport.save(options["record"])
@@ -1,25 +1,89 @@
 import json
+import time
 import httpx
+import profiler
 
 from typing import Literal, Any
 
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, message: str, status_code: int) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def get_remaining_time(deadline: float | None) -> float | None:
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0)
+
+
+def decode_json(content: bytes, fields: tuple[str, ...] | None = None) -> dict | list:
+    response = _loads(content)
+    if fields is not None and isinstance(response, dict):
+        return {field: response[field] for field in fields if field in response}
+    return response
+
 
 class Client:
     name: str
     url: str
+    timeout: float = 10.0
+    transport: httpx.AsyncBaseTransport | None = None
 
-    async def call(
+    async def _request(
         self, method: Literal["get", "post"], endpoint: str, **kwargs: Any
-    ) -> dict | list:
-        client = httpx.AsyncClient()
-        response = await getattr(client, method)(f"{self.url}{endpoint}", **kwargs)
+    ) -> httpx.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        client = httpx.AsyncClient(transport=Client.transport)
+        if profiler.is_active():
+            started_at = time.monotonic()
+            try:
+                response = await getattr(client, method)(
+                    f"{self.url}{endpoint}", **kwargs
+                )
+            except BaseException as e:
+                profiler.record_call(
+                    type(self).__name__, method, endpoint, started_at, type(e).__name__
+                )
+                raise
+            profiler.record_call(
+                type(self).__name__,
+                method,
+                endpoint,
+                started_at,
+                str(response.status_code),
+            )
+        else:
+            response = await getattr(client, method)(f"{self.url}{endpoint}", **kwargs)
         status_code = response.status_code
         if response.status_code != 200:
-            raise Exception(
-                f"{self.url} failed with status code {status_code}: {response.text}"
+            raise HTTPStatusError(
+                f"{self.url} failed with status code {status_code}: {response.text}",
+                status_code,
             )
-        else:
-            try:
-                return json.loads(response.text)
-            except:
-                raise Exception(f"{self.url} failed to parse response")
+        return response
+
+    async def call(
+        self,
+        method: Literal["get", "post"],
+        endpoint: str,
+        fields: tuple[str, ...] | None = None,
+        **kwargs: Any,
+    ) -> dict | list:
+        response = await self._request(method, endpoint, **kwargs)
+        try:
+            return decode_json(response.content, fields)
+        except:
+            raise Exception(f"{self.url} failed to parse response")
+
+    async def download(self, endpoint: str, **kwargs: Any) -> bytes:
+        response = await self._request("get", endpoint, **kwargs)
+        return response.content
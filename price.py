@@ -0,0 +1,96 @@
+import json
+import time
+import asyncio
+
+from abc import ABC, abstractmethod
+from decimal import Decimal
+
+from http_client import Client
+
+
+class PriceProvider(ABC):
+    @abstractmethod
+    async def get_prices(self, mints: list[str]) -> dict[str, Decimal]: ...
+
+
+class JupiterPriceAPI(Client, PriceProvider):
+    url = "https://lite-api.jup.ag"
+    _batch_size = 100
+
+    async def _get_prices_batch(self, mints: list[str]) -> dict[str, Decimal]:
+        response = await self.call(
+            "get", "/price/v2", params={"ids": ",".join(mints)}
+        )
+        return {
+            mint: Decimal(data["price"])
+            for mint, data in response["data"].items()  # type: ignore
+            if data is not None and data.get("price") is not None
+        }
+
+    async def get_prices(self, mints: list[str]) -> dict[str, Decimal]:
+        batches = await asyncio.gather(
+            *[
+                self._get_prices_batch(mints[i : i + self._batch_size])
+                for i in range(0, len(mints), self._batch_size)
+            ]
+        )
+        prices = {}
+        for batch in batches:
+            prices.update(batch)
+        return prices
+
+
+class StaticPriceProvider(PriceProvider):
+    def __init__(self, prices: dict[str, Decimal]) -> None:
+        self._prices = prices
+        self.requests = 0
+
+    @classmethod
+    def from_file(cls, path: str) -> "StaticPriceProvider":
+        with open(path, mode="r") as f:
+            prices = json.load(f)
+        return cls({mint: Decimal(str(prices[mint])) for mint in prices})
+
+    async def get_prices(self, mints: list[str]) -> dict[str, Decimal]:
+        self.requests += 1
+        return {mint: self._prices[mint] for mint in mints if mint in self._prices}
+
+
+class PriceCache:
+    def __init__(
+        self,
+        provider: PriceProvider,
+        ttl: float,
+        cached_prices: dict[str, list] | None = None,
+    ) -> None:
+        self._provider = provider
+        self._ttl = ttl
+        self._prices = {
+            mint: (Decimal(price), fetched_at)
+            for mint, (price, fetched_at) in (cached_prices or {}).items()
+        }
+
+    async def get_prices(self, mints: list[str]) -> dict[str, Decimal]:
+        now = time.time()
+        stale_mints = [
+            mint
+            for mint in dict.fromkeys(mints)
+            if mint not in self._prices or now - self._prices[mint][1] > self._ttl
+        ]
+        if len(stale_mints) > 0:
+            fetched_prices = await self._provider.get_prices(stale_mints)
+            for mint in fetched_prices:
+                self._prices[mint] = (fetched_prices[mint], now)
+        return {
+            mint: self._prices[mint][0]
+            for mint in mints
+            if mint in self._prices and now - self._prices[mint][1] <= self._ttl
+        }
+
+    def dump(self) -> dict[str, list]:
+        now = time.time()
+        return {
+            mint: [str(price), fetched_at]
+            for mint, (price, fetched_at) in self._prices.items()
+            if now - fetched_at <= self._ttl
+        }
@@ -0,0 +1,148 @@
+import re
+import json
+import time
+import asyncio
+import logging
+import cProfile
+import pstats
+
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Coroutine
+
+SLOW_CALLBACK_SECONDS = 0.05
+
+_timeline: list[dict] | None = None
+_origin = 0.0
+_labels: ContextVar[dict[str, str]] = ContextVar("profiler_labels", default={})
+
+
+def is_active() -> bool:
+    return _timeline is not None
+
+
+@contextmanager
+def _tagged(**labels: str):
+    token = _labels.set({**_labels.get(), **labels})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def tagged(**labels: str):
+    if _timeline is None:
+        return nullcontext()
+    return _tagged(**labels)
+
+
+def record_call(
+    client: str, method: str, endpoint: str, started_at: float, status: str
+) -> None:
+    if _timeline is None:
+        return
+    _timeline.append(
+        {
+            **_labels.get(),
+            "client": client,
+            "request": f"{method.upper()} {re.sub(r'/bot[^/]+', '/bot<redacted>', endpoint)}",
+            "start": round(started_at - _origin, 6),
+            "duration": round(time.monotonic() - started_at, 6),
+            "status": status,
+        }
+    )
+
+
+class _SlowCallbackHandler(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__(level=logging.WARNING)
+        self.records = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        message = record.getMessage()
+        if message.startswith("Executing"):
+            self.records.append(
+                {"at": round(time.monotonic() - _origin, 6), "message": message}
+            )
+
+
+def _summarize_timeline(timeline: list[dict]) -> dict:
+    summary = {}
+    for call in timeline:
+        wallet = call.get("wallet", "-")
+        stage = call.get("stage", "-")
+        if wallet not in summary:
+            summary[wallet] = {}
+        if stage not in summary[wallet]:
+            summary[wallet][stage] = {"calls": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+        stats = summary[wallet][stage]
+        stats["calls"] += 1
+        stats["total_seconds"] = round(stats["total_seconds"] + call["duration"], 6)
+        stats["max_seconds"] = max(stats["max_seconds"], call["duration"])
+    return summary
+
+
+def _get_top_functions(profile: cProfile.Profile, limit: int = 40) -> list[dict]:
+    stats = pstats.Stats(profile).stats  # type: ignore
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[0:limit]
+    return [
+        {
+            "function": f"{file_name}:{line_number}({function_name})",
+            "ncalls": ncalls,
+            "tottime": round(tottime, 6),
+            "cumtime": round(cumtime, 6),
+        }
+        for (file_name, line_number, function_name), (
+            _,
+            ncalls,
+            tottime,
+            cumtime,
+            _,
+        ) in rows
+    ]
+
+
+def run(
+    coroutine_function: Callable[..., Coroutine],
+    *args: Any,
+    name: str,
+    output_dir: str,
+) -> str:
+    global _timeline, _origin
+
+    async def _run() -> Any:
+        asyncio.get_running_loop().slow_callback_duration = SLOW_CALLBACK_SECONDS
+        return await coroutine_function(*args)
+
+    handler = _SlowCallbackHandler()
+    asyncio_logger = logging.getLogger("asyncio")
+    asyncio_logger.addHandler(handler)
+    profile = cProfile.Profile()
+    _timeline = []
+    _origin = time.monotonic()
+    try:
+        profile.enable()
+        asyncio.run(_run(), debug=True)
+    finally:
+        profile.disable()
+        wall_seconds = time.monotonic() - _origin
+        timeline, _timeline = _timeline, None
+        asyncio_logger.removeHandler(handler)
+    file_name = f"{output_dir}/{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+    profile.dump_stats(f"{file_name}.prof")
+    with open(f"{file_name}.json", mode="w") as f:
+        json.dump(
+            {
+                "method": name,
+                "args": [str(arg) for arg in args],
+                "wall_seconds": round(wall_seconds, 6),
+                "upstream_calls": _summarize_timeline(timeline),
+                "slow_callbacks": handler.records,
+                "top_functions": _get_top_functions(profile),
+                "timeline": timeline,
+            },
+            f,
+            indent=2,
+        )
+    return f"{file_name}.json"
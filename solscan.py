@@ -1,5 +1,23 @@
 from http_client import Client
 
+TRANSACTION_DETAIL_FIELDS = (
+    "tokenBalances",
+    "inputAccount",
+    "blockTime",
+    "innerInstructions",
+    "parsedInstruction",
+)
+
+
+def get_program_ids(response: dict) -> list[str]:
+    programs = {}
+    for instruction in response.get("parsedInstruction", []):
+        programs[instruction["programId"]] = None
+    for inner_instruction in response.get("innerInstructions", []):
+        for instruction in inner_instruction["parsedInstructions"]:
+            programs[instruction["programId"]] = None
+    return list(programs)
+
 
 class SolScanAPI(Client):
     url = "https://pro-api.solscan.io"
@@ -56,21 +74,18 @@ class SolScanAPI(Client):
 
     async def get_transaction_details(
         self, transaction_hash: str
-    ) -> tuple[list, list, int, set]:
+    ) -> tuple[list, list, int, list[str]]:
         response = await self.call(
             "get",
             f"/v1.0/transaction/{transaction_hash}",
+            fields=TRANSACTION_DETAIL_FIELDS,
             headers=self.headers,
         )
-        instructions = set()
-        for inner_instruction in response["innerInstructions"]:  # type: ignore
-            for instruction in inner_instruction["parsedInstructions"]:
-                instructions.add(instruction["programId"])
         return (
             response["tokenBalances"] if "tokenBalances" in response else [],  # type: ignore
             response["inputAccount"] if "inputAccount" in response else [],  # type: ignore
             response["blockTime"],  # type: ignore
-            instructions,
+            get_program_ids(response),  # type: ignore
         )
 
     async def get_transaction_actions(self, transaction_hash: str) -> dict:
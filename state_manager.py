@@ -1,24 +1,53 @@
 import os
 import json
+import time
 
-from typing import TypedDict, Any
+from typing import TypedDict, Any, NotRequired, Literal
 
 
 class TrackedWallet(TypedDict):
     name: str
     group: str
     last_updated_hash: str | None
+    mode: NotRequired[Literal["transactions", "snapshot"]]
 
 
 class ServerParams(TypedDict):
     admin_users: list[str]
     last_processed_update_id: int
+    min_usd_notional: NotRequired[dict[str, str]]
+
+
+class PendingWalletUpdate(TypedDict):
+    name: str
+    group: str
+    transactions: list[dict]
+    last_updated_hash: str
+
+
+class OutboxMessage(TypedDict):
+    chat_id: str
+    message: str
+    parse_mode: str
 
 
 class State:
     def __init__(self, root: str) -> None:
         self._root = root
 
+    def _get_dir(self, *parts: str) -> str:
+        dir_path = "/".join([self._root, *parts])
+        os.makedirs(dir_path, exist_ok=True)
+        return dir_path
+
+    def _write_json(self, file_path: str, data: Any) -> None:
+        temp_path = f"{file_path}.tmp"
+        with open(temp_path, mode="w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, file_path)
+
     def get_tracked_wallet(self, address: str) -> TrackedWallet: ...
 
     def update_tracked_wallet(self, address: str, **kwargs: Any):
@@ -26,8 +55,7 @@ class State:
         with open(file_path, mode="r") as f:
             wallet = json.load(f)
         wallet.update(kwargs)
-        with open(file_path, mode="w") as f:
-            json.dump(wallet, f)
+        self._write_json(file_path, wallet)
 
     def get_all_tracked_wallets(self) -> dict[str, TrackedWallet]:
         wallets = {}
@@ -40,15 +68,56 @@ class State:
                 wallets[address] = wallet
         return wallets
 
-    def track_new_wallet(self, address: str, name: str, group: str) -> None:
+    def track_new_wallet(
+        self, address: str, name: str, group: str, mode: str = "transactions"
+    ) -> None:
         file_path = f"{self._root}/tracked_wallets/{address}.json"
-        data = {"name": name, "group": group, "last_updated_hash": None}
+        if os.path.exists(file_path):
+            raise Exception(f"wallet {address} is already tracked")
+        if mode not in ["transactions", "snapshot"]:
+            raise Exception(f"unknown tracking mode {mode}")
+        data = {"name": name, "group": group, "last_updated_hash": None, "mode": mode}
         with open(file_path, mode="w") as f:
             json.dump(data, f)
 
+    def track_new_wallets(self, wallets: dict[str, TrackedWallet]) -> None:
+        dir_path = self._get_dir("tracked_wallets")
+        for address in wallets:
+            with open(f"{dir_path}/{address}.json.tmp", mode="w") as f:
+                json.dump(wallets[address], f)
+        os.sync()
+        for address in wallets:
+            os.replace(f"{dir_path}/{address}.json.tmp", f"{dir_path}/{address}.json")
+
+    def set_wallet_mode(self, address: str, mode: str) -> None:
+        if mode not in ["transactions", "snapshot"]:
+            raise Exception(f"unknown tracking mode {mode}")
+        file_path = f"{self._root}/tracked_wallets/{address}.json"
+        with open(file_path, mode="r") as f:
+            wallet = json.load(f)
+        if wallet.get("mode", "transactions") == mode:
+            return
+        wallet.update(mode=mode, last_updated_hash=None)
+        self._write_json(file_path, wallet)
+        self.remove_snapshot(address)
+
+    def remove_snapshot(self, address: str) -> None:
+        snapshot_path = f"{self._root}/snapshots/{address}.json"
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+
     def remove_wallet(self, address: str) -> None:
         file_path = f"{self._root}/tracked_wallets/{address}.json"
         os.remove(file_path)
+        self.remove_snapshot(address)
+        token_accounts = self.get_token_accounts()
+        kept_token_accounts = {
+            key: token_accounts[key]
+            for key in token_accounts
+            if not key.endswith(f":{address}")
+        }
+        if len(kept_token_accounts) < len(token_accounts):
+            self._write_json(f"{self._root}/token_accounts.json", kept_token_accounts)
 
     def get_server_params(self) -> ServerParams:
         file_path = f"{self._root}/server_params.json"
@@ -63,3 +132,127 @@ class State:
         server_params.update(kwargs)
         with open(file_path, mode="w") as f:
             json.dump(server_params, f)
+
+    def add_pending_wallet_update(
+        self, address: str, name: str, group: str, transactions: list[dict]
+    ) -> None:
+        file_path = f"{self._get_dir('outbox', 'wallets')}/{address}.json"
+        if os.path.exists(file_path):
+            with open(file_path, mode="r") as f:
+                pending = json.load(f)
+        else:
+            pending = {"transactions": []}
+        known_hashes = [
+            transaction["transaction_hash"] for transaction in pending["transactions"]
+        ]
+        pending["transactions"] += [
+            transaction
+            for transaction in transactions
+            if transaction["transaction_hash"] not in known_hashes
+        ]
+        pending.update(
+            name=name,
+            group=group,
+            last_updated_hash=transactions[-1]["transaction_hash"],
+        )
+        self._write_json(file_path, pending)
+
+    def get_pending_wallet_updates(self) -> dict[str, PendingWalletUpdate]:
+        pending_updates = {}
+        dir_path = self._get_dir("outbox", "wallets")
+        for file_name in os.listdir(dir_path):
+            if file_name[-5::] == ".json":
+                with open(f"{dir_path}/{file_name}", mode="r") as f:
+                    pending_updates[file_name[0:-5]] = json.load(f)
+        return pending_updates
+
+    def clear_pending_wallet_updates(self, addresses: list[str]) -> None:
+        dir_path = self._get_dir("outbox", "wallets")
+        for address in addresses:
+            if os.path.exists(f"{dir_path}/{address}.json"):
+                os.remove(f"{dir_path}/{address}.json")
+
+    def enqueue_message(
+        self, chat_id: str, message: str, parse_mode: str = "html"
+    ) -> str:
+        message_id = str(time.time_ns())
+        self._write_json(
+            f"{self._get_dir('outbox', 'messages')}/{message_id}.json",
+            {"chat_id": chat_id, "message": message, "parse_mode": parse_mode},
+        )
+        return message_id
+
+    def get_outbox_messages(self) -> list[tuple[str, OutboxMessage]]:
+        messages = []
+        dir_path = self._get_dir("outbox", "messages")
+        for file_name in sorted(os.listdir(dir_path)):
+            if file_name[-5::] == ".json":
+                with open(f"{dir_path}/{file_name}", mode="r") as f:
+                    messages.append((file_name[0:-5], json.load(f)))
+        return messages
+
+    def remove_outbox_message(self, message_id: str) -> None:
+        os.remove(f"{self._get_dir('outbox', 'messages')}/{message_id}.json")
+
+    def move_outbox_message_to_dead(self, message_id: str) -> None:
+        os.replace(
+            f"{self._get_dir('outbox', 'messages')}/{message_id}.json",
+            f"{self._get_dir('outbox', 'dead')}/{message_id}.json",
+        )
+
+    def get_price_cache(self) -> dict[str, list]:
+        file_path = f"{self._root}/prices.json"
+        if not os.path.exists(file_path):
+            return {}
+        with open(file_path, mode="r") as f:
+            return json.load(f)
+
+    def update_price_cache(self, prices: dict[str, list]) -> None:
+        self._write_json(f"{self._root}/prices.json", prices)
+
+    def get_program_labels(self) -> list[dict] | None:
+        file_path = f"{self._root}/program_labels.json"
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, mode="r") as f:
+            return json.load(f)
+
+    def get_profiles_dir(self) -> str:
+        return self._get_dir("profiles")
+
+    def get_token_accounts(self) -> dict[str, str]:
+        file_path = f"{self._root}/token_accounts.json"
+        if not os.path.exists(file_path):
+            return {}
+        with open(file_path, mode="r") as f:
+            return json.load(f)
+
+    def update_token_accounts(self, token_accounts: dict[str, str]) -> None:
+        cached_token_accounts = self.get_token_accounts()
+        cached_token_accounts.update(token_accounts)
+        self._write_json(f"{self._root}/token_accounts.json", cached_token_accounts)
+
+    def get_snapshots(self, addresses: list[str]) -> dict[str, dict[str, list]]:
+        snapshots = {}
+        dir_path = self._get_dir("snapshots")
+        for address in addresses:
+            if os.path.exists(f"{dir_path}/{address}.json"):
+                with open(f"{dir_path}/{address}.json", mode="r") as f:
+                    snapshots[address] = json.load(f)
+        return snapshots
+
+    def update_snapshot(self, address: str, snapshot: dict[str, list]) -> None:
+        self._write_json(f"{self._get_dir('snapshots')}/{address}.json", snapshot)
+
+    def get_token_metas(self) -> dict[str, dict]:
+        file_path = f"{self._root}/token_metas.json"
+        if not os.path.exists(file_path):
+            return {}
+        with open(file_path, mode="r") as f:
+            return json.load(f)
+
+    def update_token_metas(self, token_metas: dict[str, dict]) -> None:
+        cached_token_metas = self.get_token_metas()
+        if any(mint not in cached_token_metas for mint in token_metas):
+            cached_token_metas.update(token_metas)
+            self._write_json(f"{self._root}/token_metas.json", cached_token_metas)
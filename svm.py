@@ -1,16 +1,22 @@
 import json
+import time
 import asyncio
 
 from solders.pubkey import Pubkey  # type: ignore
-from typing import TypedDict, Literal, Any
+from typing import TypedDict, Literal, Any, NotRequired
 from decimal import Decimal
-from functools import cache
+from collections import deque
 
-from http_client import Client
+import profiler
+
+from http_client import Client, get_remaining_time
 from solscan import SolScanAPI
 
 SOL = "So11111111111111111111111111111111111111112"
 TOKEN_PROGRAM_ID = Pubkey.from_string("TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA")
+TOKEN_2022_PROGRAM_ID = Pubkey.from_string(
+    "TokenzQdBNbLqP5VEhdkAS6EPFLC1PHnBqCXEpPxuEb"
+)
 JUPITER_DCA = "DCA265Vj8a9CEuX1eb1LWRnDT7uK6q1xMipnNyatn23M"
 JUPITER_LIMIT_ORDER = "j1o2qRpjcyUwEvwtcfhEQefh773ZgjxcVRry7LDqg5X"
 ASSOCIATED_TOKEN_PROGRAM_ID = Pubkey.from_string(
@@ -19,15 +25,6 @@ ASSOCIATED_TOKEN_PROGRAM_ID = Pubkey.from_string(
 DUST = Decimal("0.01")
 
 
-def _get_labels(programs: set) -> str:
-    labels = []
-    if JUPITER_DCA in programs:
-        labels.append("Jupiter DCA")
-    if JUPITER_LIMIT_ORDER in programs:
-        labels.append("Jupiter Limit Order")
-    return ", ".join(labels)
-
-
 class SPL(TypedDict):
     ticker: str
     name: str
@@ -38,6 +35,7 @@ class SPL(TypedDict):
 class TokenAction(TypedDict):
     token: Literal["SOL"] | SPL
     amount: Decimal
+    usd_value: NotRequired[Decimal]
 
 
 class Transaction(TypedDict):
@@ -45,14 +43,343 @@ class Transaction(TypedDict):
     token_actions: list[TokenAction]
     block_time: int
     labels: str
+    account: NotRequired[str]
 
 
-class RPC(Client):
-    _version = "2.0"
+class ProgramLabel(TypedDict):
+    label: str
+    category: str
+    programs: list[str]
+
+
+NON_SWAP_CATEGORIES = {"staking", "lending", "bridge"}
+
+DEFAULT_PROGRAM_LABELS: list[ProgramLabel] = [
+    {"label": "Jupiter DCA", "category": "dca", "programs": [JUPITER_DCA]},
+    {
+        "label": "Jupiter Limit Order",
+        "category": "limit_order",
+        "programs": [JUPITER_LIMIT_ORDER],
+    },
+    {
+        "label": "Jupiter",
+        "category": "swap",
+        "programs": [
+            "JUP6LkbZbjS1jKKwapdHNy74zcZ3tLUZoi5QNyVTaV4",
+            "JUP4Fb2cqiRUcaTHdrPC8h2gNsA2ETXiPDD33WcGuJB",
+        ],
+    },
+    {
+        "label": "Raydium",
+        "category": "swap",
+        "programs": [
+            "675kPX9MHTjS2zt1qfr1NYHuzeLXfQM9H24wFSUt1Mp8",
+            "CAMMCzo5YL8w4VFF8KVHrK22GGUsp5VTaW7grrKgrWqK",
+        ],
+    },
+    {
+        "label": "Orca",
+        "category": "swap",
+        "programs": ["whirLbMiicVdio4qvUfM5KAg6Ct8VwpYzGff3uctyCc"],
+    },
+    {
+        "label": "Meteora",
+        "category": "swap",
+        "programs": ["LBUZKhRxPF3XUpBCjp4YzTKgLccjZhTSDM9YuVaPwxo"],
+    },
+    {
+        "label": "pump.fun",
+        "category": "swap",
+        "programs": ["6EF8rrecthR5Dkzon8Nwu78hRvfCKubJ14M5uBEwF6P"],
+    },
+    {
+        "label": "Wormhole",
+        "category": "bridge",
+        "programs": ["wormDTUJ6AWPNvk59vGQbDvGJmqbDTdgWgAqcLBCgUb"],
+    },
+    {
+        "label": "Marinade",
+        "category": "staking",
+        "programs": ["MarBmsSgKXdrN1egZf5sqe1TMai9K1rChYNDJgjq7aD"],
+    },
+    {
+        "label": "Kamino Lend",
+        "category": "lending",
+        "programs": ["KLend2g3cP87fffoy8q1mQqGKjrxjC8boSyAYavgmjD"],
+    },
+    {
+        "label": "marginfi",
+        "category": "lending",
+        "programs": ["MFv2hWf31Z9kbCa1snEPYctwafyhdvnV7FZnsebVacA"],
+    },
+    {
+        "label": "Solend",
+        "category": "lending",
+        "programs": ["So1endDq2YkqhipRh3WViPa8hdiSpxWy6z3Z6tMCpAo"],
+    },
+]
+
+
+def compile_program_labels(
+    program_labels: list[ProgramLabel],
+) -> dict[str, tuple[str, str]]:
+    label_index = {}
+    for program_label in program_labels:
+        for program in program_label["programs"]:
+            label_index[program] = (program_label["label"], program_label["category"])
+    return label_index
+
+
+def classify_transaction(
+    programs: list[str],
+    token_actions: list[TokenAction],
+    label_index: dict[str, tuple[str, str]],
+) -> str:
+    labels = {}
+    categories = set()
+    for program in programs:
+        if program in label_index:
+            label, category = label_index[program]
+            labels[label] = None
+            categories.add(category)
+    has_inflow = any(token_action["amount"] > 0 for token_action in token_actions)
+    has_outflow = any(token_action["amount"] < 0 for token_action in token_actions)
+    if len(categories & NON_SWAP_CATEGORIES) > 0:
+        kind = []
+    elif "swap" in categories or (len(labels) == 0 and has_inflow and has_outflow):
+        kind = ["Swap"]
+    elif len(labels) == 0 and len(token_actions) > 0:
+        kind = ["Transfer"]
+    else:
+        kind = []
+    return ", ".join(kind + list(labels))
+
+
+def is_valid_address(address: str) -> bool:
+    try:
+        Pubkey.from_string(address)
+    except ValueError:
+        return False
+    return True
+
+
+def diff_snapshots(
+    previous: dict[str, list], current: dict[str, list], token_metas: dict[str, SPL]
+) -> list[TokenAction]:
+    token_actions = []
+    for mint in dict.fromkeys([*previous, *current]):
+        amount, decimals = current[mint] if mint in current else ["0", previous[mint][1]]
+        previous_amount = previous[mint][0] if mint in previous else "0"
+        change = (Decimal(amount) - Decimal(previous_amount)) / Decimal(10**decimals)
+        if change > DUST or change < -DUST:
+            if mint == "SOL":
+                token = "SOL"
+            elif mint in token_metas:
+                token = token_metas[mint]
+            else:
+                token = {
+                    "ticker": f"{mint[0:4]}..{mint[-4::]}",
+                    "name": mint,
+                    "mint": mint,
+                    "decimals": decimals,
+                }
+            token_actions.append({"token": token, "amount": change})
+    return token_actions
+
+
+def get_token_mint(token_action: TokenAction) -> str:
+    return SOL if token_action["token"] == "SOL" else token_action["token"]["mint"]
+
+
+def serialize_transaction(transaction: Transaction) -> dict:
+    return {
+        **transaction,
+        "token_actions": [
+            {
+                key: value if key == "token" else str(value)
+                for key, value in token_action.items()
+            }
+            for token_action in transaction["token_actions"]
+        ],
+    }
+
+
+def deserialize_transaction(data: dict) -> Transaction:
+    return {
+        **data,  # type: ignore
+        "token_actions": [
+            {
+                key: value if key == "token" else Decimal(value)
+                for key, value in token_action.items()
+            }
+            for token_action in data["token_actions"]
+        ],
+    }
+
+
+class RPCEndpoint(Client):
+    _window = 100
+    _default_hedge_delay = 1.0
+    _failure_threshold = 3
+    _base_cooldown = 5.0
+    _max_cooldown = 300.0
 
     def __init__(self, rpc_url: str) -> None:
         self.url = rpc_url
+        self._latencies = deque(maxlen=self._window)
+        self._outcomes = deque(maxlen=self._window)
+        self._consecutive_failures = 0
+        self._cooldown = self._base_cooldown
+        self._unhealthy_until = 0.0
+
+    @property
+    def error_rate(self) -> float:
+        if len(self._outcomes) == 0:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def _percentile(self, percentile: float) -> float | None:
+        if len(self._latencies) == 0:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[min(int(len(latencies) * percentile), len(latencies) - 1)]
+
+    @property
+    def hedge_delay(self) -> float:
+        if len(self._latencies) < 10:
+            return self._default_hedge_delay
+        return self._percentile(0.95)  # type: ignore
+
+    @property
+    def score(self) -> float:
+        median = self._percentile(0.5)
+        latency = median if median is not None else self._default_hedge_delay
+        return latency * (1 + 10 * self.error_rate)
+
+    def is_healthy(self, now: float) -> bool:
+        return now >= self._unhealthy_until
+
+    def needs_probe(self, now: float) -> bool:
+        return self._consecutive_failures >= self._failure_threshold and self.is_healthy(
+            now
+        )
+
+    def hold_for_probe(self, now: float) -> None:
+        self._unhealthy_until = now + self._cooldown
+
+    @property
+    def unhealthy_until(self) -> float:
+        return self._unhealthy_until
+
+    def record_success(self, latency: float) -> None:
+        self._latencies.append(latency)
+        self._outcomes.append(True)
+        self._consecutive_failures = 0
+        self._cooldown = self._base_cooldown
+        self._unhealthy_until = 0.0
+
+    def record_failure(self) -> None:
+        self._outcomes.append(False)
+        self._consecutive_failures += 1
+        if self._consecutive_failures >= self._failure_threshold:
+            self._unhealthy_until = time.monotonic() + self._cooldown
+            self._cooldown = min(self._cooldown * 2, self._max_cooldown)
+
+    def record_lost_hedge(self, latency: float) -> None:
+        self._latencies.append(latency)
+        self.record_failure()
+
+    async def timed_call(self, data: str) -> dict:
+        start = time.monotonic()
+        try:
+            response = await self.call(
+                "post",
+                "",
+                data=data,
+                headers={"Content-Type": "application/json"},
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success(time.monotonic() - start)
+        return response  # type: ignore
+
+
+class RPC:
+    _version = "2.0"
+    _max_concurrent_batches = 4
+
+    def __init__(self, rpc_urls: str | list[str]) -> None:
+        if isinstance(rpc_urls, str):
+            rpc_urls = [rpc_urls]
+        self.endpoints = [RPCEndpoint(rpc_url) for rpc_url in rpc_urls]
         self._current_id = 1
+        self._probes = set()
+        self._batch_semaphore = asyncio.Semaphore(self._max_concurrent_batches)
+
+    def _probe(self, endpoint: RPCEndpoint) -> None:
+        data = json.dumps(
+            {"jsonrpc": self._version, "id": 0, "method": "getHealth", "params": []}
+        )
+        task = asyncio.create_task(endpoint.timed_call(data))
+        self._probes.add(task)
+        task.add_done_callback(self._probes.discard)
+        task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    def _rank_endpoints(self) -> list[RPCEndpoint]:
+        now = time.monotonic()
+        healthy = []
+        for endpoint in self.endpoints:
+            if endpoint.needs_probe(now):
+                endpoint.hold_for_probe(now)
+                self._probe(endpoint)
+            elif endpoint.is_healthy(now):
+                healthy.append(endpoint)
+        if len(healthy) == 0:
+            return sorted(self.endpoints, key=lambda endpoint: endpoint.unhealthy_until)
+        return sorted(healthy, key=lambda endpoint: endpoint.score)
+
+    async def _hedged_call(self, data: str) -> Any:
+        candidates = self._rank_endpoints()
+        current = candidates[0]
+        started_at = {}
+        pending = {asyncio.create_task(current.timed_call(data))}
+        started_at[next(iter(pending))] = (current, time.monotonic())
+        launched = 1
+        hedged = False
+        error = None
+        winner_started = None
+        try:
+            while len(pending) > 0:
+                hedge_delay = (
+                    current.hedge_delay
+                    if not hedged and len(pending) == 1 and launched < len(candidates)
+                    else None
+                )
+                done, pending = await asyncio.wait(
+                    pending, timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        winner_started = started_at[task][1]
+                        return task.result()
+                    error = task.exception()
+                if launched < len(candidates) and (len(done) == 0 or len(pending) == 0):
+                    hedged = hedged or len(done) == 0
+                    current = candidates[launched]
+                    task = asyncio.create_task(current.timed_call(data))
+                    started_at[task] = (current, time.monotonic())
+                    pending.add(task)
+                    launched += 1
+        finally:
+            for task in pending:
+                task.cancel()
+                endpoint, started = started_at[task]
+                if winner_started is not None and started < winner_started:
+                    endpoint.record_lost_hedge(time.monotonic() - started)
+        raise error  # type: ignore
 
     async def http_method(self, method: str, *params: Any) -> dict:
         data = json.dumps(
@@ -64,38 +391,152 @@ class RPC(Client):
             }
         )
         self._current_id += 1
-        return await self.call(
-            "post",
-            "",
-            data=data,
-            headers={"Content-Type": "application/json"},
-        )  # type: ignore
+        with profiler.tagged(rpc_method=method):
+            return await self._hedged_call(data)
+
+    async def _limited_batch_call(self, batch: list[dict]) -> Any:
+        async with self._batch_semaphore:
+            return await self._hedged_call(json.dumps(batch))
+
+    async def http_batch(
+        self, calls: list[tuple[str, list]], batch_size: int = 100
+    ) -> list[dict]:
+        batches = []
+        for i in range(0, len(calls), batch_size):
+            batch = []
+            for method, params in calls[i : i + batch_size]:
+                batch.append(
+                    {
+                        "jsonrpc": self._version,
+                        "id": self._current_id,
+                        "method": method,
+                        "params": params,
+                    }
+                )
+                self._current_id += 1
+            batches.append(batch)
+        with profiler.tagged(rpc_method="batch"):
+            responses = await asyncio.gather(
+                *[self._limited_batch_call(batch) for batch in batches]
+            )
+        results = []
+        for batch, response in zip(batches, responses):
+            if not isinstance(response, list):
+                error = (
+                    response.get("error", response)
+                    if isinstance(response, dict)
+                    else response
+                )
+                results += [{"id": call["id"], "error": error} for call in batch]
+                continue
+            response_by_id = {
+                item["id"]: item
+                for item in response
+                if isinstance(item, dict) and "id" in item
+            }
+            results += [
+                response_by_id.get(
+                    call["id"], {"id": call["id"], "error": "missing from batch reply"}
+                )
+                for call in batch
+            ]
+        return results
 
 
 class Solana:
-    def __init__(self, rpc_url: str, solscan_api_token: str) -> None:
-        self.rpc = RPC(rpc_url)
+    def __init__(
+        self,
+        rpc_urls: str | list[str],
+        solscan_api_token: str,
+        program_labels: list[ProgramLabel] | None = None,
+    ) -> None:
+        self.rpc = RPC(rpc_urls)
         self.solscan_api = SolScanAPI(solscan_api_token)
+        self.label_index = compile_program_labels(
+            program_labels if program_labels is not None else DEFAULT_PROGRAM_LABELS
+        )
+        self._token_accounts = {}
+
+    def load_token_accounts(self, token_accounts: dict[str, str]) -> None:
+        self._token_accounts.update(token_accounts)
 
-    @cache
     def get_associated_token_account(self, mint: str, owner: str) -> str:
-        key, _ = Pubkey.find_program_address(
-            seeds=[
-                bytes(Pubkey.from_string(owner)),
-                bytes(TOKEN_PROGRAM_ID),
-                bytes(Pubkey.from_string(mint)),
-            ],
-            program_id=ASSOCIATED_TOKEN_PROGRAM_ID,
+        cache_key = f"{mint}:{owner}"
+        if cache_key not in self._token_accounts:
+            key, _ = Pubkey.find_program_address(
+                seeds=[
+                    bytes(Pubkey.from_string(owner)),
+                    bytes(TOKEN_PROGRAM_ID),
+                    bytes(Pubkey.from_string(mint)),
+                ],
+                program_id=ASSOCIATED_TOKEN_PROGRAM_ID,
+            )
+            self._token_accounts[cache_key] = str(key)
+        return self._token_accounts[cache_key]
+
+    async def get_latest_signatures(self, accounts: list[str]) -> dict[str, str | None]:
+        responses = await self.rpc.http_batch(
+            [("getSignaturesForAddress", [account, {"limit": 1}]) for account in accounts]
         )
-        return str(key)
+        return {
+            account: (
+                response["result"][0]["signature"]
+                if "result" in response and len(response["result"]) > 0
+                else None
+            )
+            for account, response in zip(accounts, responses)
+        }
+
+    async def get_portfolio_snapshots(
+        self, accounts: list[str]
+    ) -> dict[str, dict[str, list]]:
+        calls = []
+        for account in accounts:
+            for program_id in [TOKEN_PROGRAM_ID, TOKEN_2022_PROGRAM_ID]:
+                calls.append(
+                    (
+                        "getTokenAccountsByOwner",
+                        [
+                            account,
+                            {"programId": str(program_id)},
+                            {"encoding": "jsonParsed"},
+                        ],
+                    )
+                )
+            calls.append(("getBalance", [account]))
+        responses = await self.rpc.http_batch(calls)
+        snapshots = {}
+        for i, account in enumerate(accounts):
+            token_accounts, token_2022_accounts, balance = responses[3 * i : 3 * i + 3]
+            if any(
+                "result" not in response
+                for response in [token_accounts, token_2022_accounts, balance]
+            ):
+                continue
+            snapshot = {"SOL": [str(balance["result"]["value"]), 9]}
+            for token_account in (
+                token_accounts["result"]["value"] + token_2022_accounts["result"]["value"]
+            ):
+                info = token_account["account"]["data"]["parsed"]["info"]
+                amount = int(info["tokenAmount"]["amount"])
+                if amount > 0:
+                    mint = info["mint"]
+                    previous_amount = int(snapshot[mint][0]) if mint in snapshot else 0
+                    snapshot[mint] = [
+                        str(previous_amount + amount),
+                        info["tokenAmount"]["decimals"],
+                    ]
+            snapshots[account] = snapshot
+        return snapshots
 
     async def get_spl_balance(self, account: str, token: SPL) -> Decimal:
         mint = token["mint"]
         decimals = token["decimals"]
         token_account = self.get_associated_token_account(mint, account)
-        response = await self.rpc.http_method(
-            "getAccountInfo", token_account, {"encoding": "jsonParsed"}
-        )
+        with profiler.tagged(wallet=account):
+            response = await self.rpc.http_method(
+                "getAccountInfo", token_account, {"encoding": "jsonParsed"}
+            )
         if response["result"]["value"] is None:
             return Decimal("0")
         else:
@@ -110,19 +551,47 @@ class Solana:
         after_hash: str | None = None,
         limit: int = 10,
         ignore_internal_transfers: list[str] | None = None,
-    ) -> list[Transaction]:
-        trasnaction_hashes = await self.solscan_api.get_transactions_for_account(
-            account, after_hash=after_hash, limit=limit
-        )
-        interpreted_transactions = await asyncio.gather(
-            *[
-                self.interpret_transaction(
-                    transaction_hash,
-                    account,
-                    ignore_internal_transfers=ignore_internal_transfers,
+        deadline: float | None = None,
+    ) -> tuple[list[Transaction], str | None]:
+        with profiler.tagged(stage="list_transactions"):
+            trasnaction_hashes = await asyncio.wait_for(
+                self.solscan_api.get_transactions_for_account(
+                    account, after_hash=after_hash, limit=limit
+                ),
+                timeout=get_remaining_time(deadline),
+            )
+        with profiler.tagged(stage="interpret_transaction"):
+            tasks = [
+                asyncio.create_task(
+                    self.interpret_transaction(
+                        transaction_hash,
+                        account,
+                        ignore_internal_transfers=ignore_internal_transfers,
+                        deadline=deadline,
+                    )
                 )
                 for transaction_hash in trasnaction_hashes
             ]
+        try:
+            if len(tasks) > 0:
+                await asyncio.wait(tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        interpreted_transactions = []
+        for task in tasks[::-1]:
+            if task.exception() is None:
+                interpreted_transactions.append(task.result())
+            elif isinstance(task.exception(), asyncio.TimeoutError):
+                break
+            else:
+                raise task.exception()  # type: ignore
+        if len(tasks) > 0 and len(interpreted_transactions) == 0:
+            raise asyncio.TimeoutError()
+        checkpoint = (
+            interpreted_transactions[-1]["transaction_hash"]
+            if len(interpreted_transactions) > 0
+            else None
         )
         return [
             transaction
@@ -134,17 +603,19 @@ class Solana:
                 len(transaction["token_actions"]) == 1
                 and transaction["token_actions"][0]["token"] == "SOL"
             )
-        ]
+        ], checkpoint
 
     async def interpret_transaction(
         self,
         transaction_hash: str,
         owner: str,
         ignore_internal_transfers: list[str] | None = None,
+        deadline: float | None = None,
     ) -> Transaction:
         token_actions = []
-        token_balances, input_accounts, block_time, programs = (
-            await self.solscan_api.get_transaction_details(transaction_hash)
+        token_balances, input_accounts, block_time, programs = await asyncio.wait_for(
+            self.solscan_api.get_transaction_details(transaction_hash),
+            timeout=get_remaining_time(deadline),
         )
         token_balance_changes = {}
         token_metas = {}
@@ -206,5 +677,5 @@ class Solana:
             "transaction_hash": transaction_hash,
             "token_actions": token_actions,
             "block_time": block_time,
-            "labels": _get_labels(programs),
+            "labels": classify_transaction(programs, token_actions, self.label_index),
         }
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Any, TypedDict
+from typing import Any, TypedDict, NotRequired
 from decimal import Decimal
 
 from http_client import Client
@@ -23,11 +23,11 @@ The first line will be a telegram command with the name of the method, the follo
 <b>show_tracked_wallets</b>(group)
  - show all tracked wallets for group, if group is not passed, show all tracked wallets for all groups
 
-<b>add_wallet</b>(address, name, group)
- - add a new wallet to track (admin only)
+<b>add_wallet</b>(address, name, group, mode)
+ - add a new wallet to track, mode is transactions (default) or snapshot, snapshot only reports position changes between cycles (admin only)
 
-<b>update_wallet</b>(address, name, group)
- - updated tracked wallet, name and group are optional arguments (admin only)
+<b>update_wallet</b>(address, name, group, mode)
+ - updated tracked wallet, name, group and mode are optional arguments (admin only)
 
 <b>remove_wallet</b>(address)
  - remove a wallet from tracker (admin only)
@@ -35,14 +35,29 @@ The first line will be a telegram command with the name of the method, the follo
 <b>rename_group</b>(group, new_name)
  - rename a group (admin only)
 
+<b>import_wallets</b>(seed_checkpoints)
+ - send as the caption of a CSV or JSON file with address, name and group for each wallet, existing wallets are skipped, seed_checkpoints: true starts new wallets from their latest transaction (admin only)
+
+<b>export_wallets</b>(format)
+ - export all tracked wallets as csv or json, csv by default
+
+<b>set_min_notional</b>(group, usd)
+ - hide token moves worth less than usd for group, 0 disables the filter (admin only)
+
 """
 
 
+class TelegramDocument(TypedDict):
+    file_id: str
+    file_name: str
+
+
 class TelegramMethod(TypedDict):
     user: str
     method: str
     kwargs: dict[str, str]
     update_id: int
+    document: NotRequired[TelegramDocument]
 
 
 def _parse_token_action(token_action: TokenAction) -> str:
@@ -52,14 +67,23 @@ def _parse_token_action(token_action: TokenAction) -> str:
         else f"<b>{token_action['token']['ticker']}</b>"
     )
     positive_sign = "+" if token_action["amount"] > Decimal("0") else ""
-    return f"<b>{positive_sign}{token_action['amount']}</b> {identifier}"
+    usd_value = (
+        f" (~${abs(token_action['usd_value']):,.2f})"
+        if "usd_value" in token_action
+        else ""
+    )
+    return f"<b>{positive_sign}{token_action['amount']}</b> {identifier}{usd_value}"
 
 
 def generate_transaction_message(
     group: str, name: str, transaction: Transaction
 ) -> str:
     time = datetime.fromtimestamp(transaction["block_time"])
-    transaction_hash = transaction["transaction_hash"]
+    link = (
+        f'<a href="https://solscan.io/account/{transaction["account"]}"><u>View Account</u></a>'
+        if "account" in transaction
+        else f'<a href="https://solscan.io/tx/{transaction["transaction_hash"]}"><u>View Transaction</u></a>'
+    )
     labels = (
         "" if not transaction["labels"] else "\nLabels: " + transaction["labels"] + "\n"
     )
@@ -70,7 +94,7 @@ def generate_transaction_message(
             [_parse_token_action(token) for token in transaction["token_actions"]]
         )
         + labels
-        + f'\n\n<a href="https://solscan.io/tx/{transaction_hash}"><u>View Transaction</u></a>'
+        + f"\n\n{link}"
     )
     return message
 
@@ -102,12 +126,17 @@ class TelegramBot(Client):
             if "message" in update
             and update["update_id"] > after_id
             and str(update["message"]["chat"]["id"]) == chat_id
-            and "entities" in update["message"]
             and "bot_command"
-            in [entity["type"] for entity in update["message"]["entities"]]
+            in [
+                entity["type"]
+                for entity in update["message"].get(
+                    "entities", update["message"].get("caption_entities", [])
+                )
+            ]
         ]
         for update in relevant_updates:
-            lines = update["message"]["text"].split("\n")
+            text = update["message"].get("text", update["message"].get("caption", ""))
+            lines = text.split("\n")
             method = lines[0].strip()[1::]
             if " " not in method:
                 kwargs = {}
@@ -118,14 +147,20 @@ class TelegramBot(Client):
                         value = key_and_value[1].strip()
                         if " " not in key:
                             kwargs[key] = value
-                telegram_methods.append(
-                    {
-                        "method": method,
-                        "kwargs": kwargs,
-                        "user": update["message"]["from"]["username"],
-                        "update_id": update["update_id"],
+                telegram_method = {
+                    "method": method,
+                    "kwargs": kwargs,
+                    "user": update["message"]["from"]["username"],
+                    "update_id": update["update_id"],
+                }
+                if "document" in update["message"]:
+                    telegram_method["document"] = {
+                        "file_id": update["message"]["document"]["file_id"],
+                        "file_name": update["message"]["document"].get(
+                            "file_name", ""
+                        ),
                     }
-                )
+                telegram_methods.append(telegram_method)
         return sorted(telegram_methods, key=lambda x: x["update_id"])
 
     async def send_message(
@@ -136,3 +171,23 @@ class TelegramBot(Client):
             f"/bot{self._bot_token}/sendMessage",
             params={"chat_id": chat_id, "parse_mode": parse_mode, "text": message},
         )
+
+    async def download_document(self, file_id: str) -> bytes:
+        response = await self.call(
+            "get",
+            f"/bot{self._bot_token}/getFile",
+            params={"file_id": file_id},
+        )
+        return await self.download(
+            f"/file/bot{self._bot_token}/{response['result']['file_path']}"  # type: ignore
+        )
+
+    async def send_document(
+        self, chat_id: str, file_name: str, content: bytes, caption: str = ""
+    ) -> Any:
+        return await self.call(
+            "post",
+            f"/bot{self._bot_token}/sendDocument",
+            data={"chat_id": chat_id, "caption": caption, "parse_mode": "html"},
+            files={"document": (file_name, content)},
+        )